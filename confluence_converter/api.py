@@ -1,21 +1,27 @@
 from __future__ import annotations
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-from requests.session import Session
+from requests.sessions import Session
+from urllib3.util.retry import Retry
 
 LOG = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class ConfluenceConfig:
     base_url: str
     email: str
     api_token: str
+    max_workers: int = 20
+    use_v2_api: bool = False
 
 
 class ConfluenceClient:
@@ -23,11 +29,28 @@ class ConfluenceClient:
 
     def __init__(self, config: ConfluenceConfig) -> None:
         self._config = config
+        # Page titles seen through the v2 API, used to resolve ancestor titles without refetching.
+        self._titles: Dict[str, str] = {}
         self._session: Session = requests.Session()
         self._session.auth = HTTPBasicAuth(config.email, config.api_token)
         self._session.headers.update({"Accept": "application/json"})
+        # Size the pool for concurrent callers so connections are reused, not discarded, and
+        # retry throttled or failed GETs with backoff. Once retries run out the last response is
+        # returned, so callers still see an HTTPError from raise_for_status().
+        retry = Retry(
+            total=5,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=config.max_workers, max_retries=retry)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
 
     def fetch_page(self, page_id: str) -> Dict:
+        if self._config.use_v2_api:
+            return self._fetch_page_v2(page_id)
         url = f"{self._config.base_url}/rest/api/content/{page_id}"
         params = {"expand": "body.storage,version,ancestors"}
         LOG.debug("Fetching page %s", page_id)
@@ -36,6 +59,8 @@ class ConfluenceClient:
         return response.json()
 
     def fetch_children_ids(self, page_id: str) -> List[str]:
+        if self._config.use_v2_api:
+            return self._fetch_children_ids_v2(page_id)
         url = f"{self._config.base_url}/rest/api/content/{page_id}/child/page"
         children: List[str] = []
         start = 0
@@ -48,27 +73,91 @@ class ConfluenceClient:
             response.raise_for_status()
             payload = response.json()
             results = payload.get("results", [])
-            children.extend([str(result["id"]) for result in results if "id" in result])
+            children.extend(str(result["id"]) for result in results if "id" in result)
             if payload.get("_links", {}).get("next") is None:
                 break
             start += limit
 
         return children
 
+    def _fetch_page_v2(self, page_id: str) -> Dict:
+        """Fetch a page through the v2 API, shaped like the v1 content payload."""
+        url = f"{self._config.base_url}/api/v2/pages/{page_id}"
+        LOG.debug("Fetching page %s (v2)", page_id)
+        response = self._session.get(url, params={"body-format": "storage"}, timeout=30)
+        response.raise_for_status()
+        page = response.json()
+        self._titles[str(page.get("id", page_id))] = page.get("title", "")
+
+        version = page.get("version", {}) or {}
+        return {
+            "id": page.get("id", page_id),
+            "title": page.get("title", "Untitled Page"),
+            "version": {"number": version.get("number", 1), "when": version.get("createdAt")},
+            # v2 has no ancestors expansion, so they are resolved separately.
+            "ancestors": self._fetch_ancestors_v2(page_id),
+            "body": page.get("body", {}),
+            "_links": page.get("_links", {}),
+        }
+
+    def _fetch_ancestors_v2(self, page_id: str) -> List[Dict]:
+        url = f"{self._config.base_url}/api/v2/pages/{page_id}/ancestors"
+        results = self._iter_results_v2(url, {"limit": 250})
+        ancestor_ids = [str(result["id"]) for result in results if "id" in result]
+        # The ancestors endpoint returns ids only; look up titles not seen yet in one batch.
+        missing = [ancestor_id for ancestor_id in ancestor_ids if ancestor_id not in self._titles]
+        if missing:
+            params = {"id": ",".join(missing), "limit": 250}
+            for result in self._iter_results_v2(f"{self._config.base_url}/api/v2/pages", params):
+                self._titles[str(result["id"])] = result.get("title", "")
+        return [
+            {"id": ancestor_id, "title": self._titles.get(ancestor_id, "")}
+            for ancestor_id in ancestor_ids
+        ]
+
+    def _fetch_children_ids_v2(self, page_id: str) -> List[str]:
+        url = f"{self._config.base_url}/api/v2/pages/{page_id}/children"
+        children: List[str] = []
+        LOG.debug("Fetching children of %s (v2)", page_id)
+        for result in self._iter_results_v2(url, {"limit": 250}):
+            if "id" not in result:
+                continue
+            child_id = str(result["id"])
+            self._titles[child_id] = result.get("title", "")
+            children.append(child_id)
+        return children
+
+    def _iter_results_v2(self, url: str, params: Optional[Dict]) -> Iterator[Dict]:
+        """Yield results from a v2 list endpoint, following the ``_links.next`` cursor."""
+        next_url: Optional[str] = url
+        while next_url:
+            response = self._session.get(next_url, params=params, timeout=30)
+            response.raise_for_status()
+            payload = response.json()
+            yield from payload.get("results", [])
+            # The next link is site-relative (/wiki/api/v2/...) and already carries the query.
+            next_link = payload.get("_links", {}).get("next")
+            next_url = urljoin(self._config.base_url, next_link) if next_link else None
+            params = None
+
     def traverse_descendants(self, root_id: str, include_children: bool) -> Iterator[str]:
         """Yield page IDs to process, starting with the root and optionally all descendants."""
         yield root_id
         if not include_children:
             return
 
-        queue: List[str] = [root_id]
+        # Walk the tree one level at a time, fetching every node's children concurrently.
+        # Results are consumed in level order, so the yield order matches a serial BFS.
+        level: List[str] = [root_id]
         seen = {root_id}
-        while queue:
-            current = queue.pop(0)
-            for child_id in self.fetch_children_ids(current):
-                if child_id in seen:
-                    continue
-                seen.add(child_id)
-                queue.append(child_id)
-                yield child_id
-
+        with ThreadPoolExecutor(max_workers=self._config.max_workers) as pool:
+            while level:
+                next_level: List[str] = []
+                for child_ids in pool.map(self.fetch_children_ids, level):
+                    for child_id in child_ids:
+                        if child_id in seen:
+                            continue
+                        seen.add(child_id)
+                        next_level.append(child_id)
+                        yield child_id
+                level = next_level
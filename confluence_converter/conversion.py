@@ -4,19 +4,40 @@ import datetime as dt
 import logging
 import re
 from dataclasses import dataclass
+from html import escape
 from typing import Dict, List, Optional, Tuple
 
-from bs4 import BeautifulSoup, Tag
-from markdownify import markdownify as md
+from bs4 import BeautifulSoup, NavigableString, Tag
+from bs4.element import PreformattedString
 
-from .utils import chunk_sentences, sha256_text, slugify_path, slugify_text, split_into_sentences
+from .utils import (
+    chunk_sentences,
+    fingerprint_text,
+    sha256_text,
+    slugify_path,
+    slugify_text,
+    split_into_sentences,
+)
 
 LOG = logging.getLogger(__name__)
 
 HEADING_TAGS = {"h1", "h2", "h3"}
 
+# Section body fingerprint -> [[chunk_text, text_hash], ...] for a single page.
+SectionCache = Dict[str, List[List[str]]]
 
-@dataclass
+# lxml's HTML parser turns CDATA sections (used by Confluence code and link
+# macros) into comments, so their content is inlined as escaped text first.
+_CDATA_RE = re.compile(r"<!\[CDATA\[(.*?)\]\]>", re.DOTALL)
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+# Section headings, matched across the whole Markdown document in one scan.
+_HEADING_RE = re.compile(r"^#{1,3}[^\S\n]+([^\n]*)", re.MULTILINE)
+_WHITESPACE_RE = re.compile(r"\s+")
+_GAP_LINES_RE = re.compile(r"\n\s*\n")
+_INLINE_MARKERS = {"strong": "**", "b": "**", "em": "*", "i": "*", "code": "`"}
+
+
+@dataclass(slots=True)
 class Section:
     id: str
     title: str
@@ -26,34 +47,156 @@ class Section:
 
 
 def _clean_html(html: str) -> BeautifulSoup:
-    soup = BeautifulSoup(html or "", "html.parser")
-
-    for tag in soup(["script", "style"]):
-        tag.decompose()
+    html = _CDATA_RE.sub(lambda match: escape(match.group(1), quote=False), html or "")
+    soup = BeautifulSoup(html, "lxml")
 
-    for tag in soup.find_all(lambda t: isinstance(t, Tag) and ":" in t.name):
-        # Replace Confluence macro nodes with their visible text.
-        text = tag.get_text(" ", strip=True)
-        if text:
-            tag.replace_with(text)
-        else:
+    # Single pass in reverse document order, so children are handled before their parents.
+    for tag in reversed(soup.find_all(True)):
+        if tag.name in ("script", "style"):
             tag.decompose()
+        elif tag.name == "ac:plain-text-body":
+            continue  # Handled with its macro below.
+        elif ":" in tag.name:
+            plain_body = tag.find("ac:plain-text-body", recursive=False)
+            if plain_body is not None:
+                # Code and noformat macros become a preformatted block of their body, keeping
+                # its line breaks. Their parameters (language, theme, ...) are not visible text.
+                pre = soup.new_tag("pre")
+                pre.string = plain_body.get_text()
+                tag.replace_with(pre)
+                continue
+            if tag.find("pre") is not None:
+                # Flattening would collapse nested code blocks, so keep the macro's content.
+                tag.unwrap()
+                continue
+            # Replace other Confluence macro nodes with their visible text.
+            text = tag.get_text(" ", strip=True)
+            if text:
+                tag.replace_with(text)
+            else:
+                tag.decompose()
+        elif tag.name in ("span", "div"):
+            tag.unwrap()
 
     return soup
 
 
 def _html_to_markdown(soup: BeautifulSoup) -> str:
-    # markdownify expects a string input.
-    markdown = md(
-        str(soup),
-        heading_style="ATX",
-        strip=["span", "div"],
-        convert=["table", "ol", "ul"],
-    )
-    markdown = re.sub(r"\n{3,}", "\n\n", markdown).strip()
+    markdown = _render_children(soup)
+    markdown = _BLANK_LINES_RE.sub("\n\n", markdown).strip()
     return markdown
 
 
+def _render_children(node: Tag) -> str:
+    parts: List[str] = []
+    for child in node.children:
+        if isinstance(child, Tag):
+            text = _render_tag(child)
+        elif isinstance(child, NavigableString) and not isinstance(child, PreformattedString):
+            text = _WHITESPACE_RE.sub(" ", str(child))
+        else:
+            continue
+        if not text:
+            continue
+        # Drop the collapsed whitespace that would otherwise pad lines around block boundaries.
+        if parts and parts[-1].endswith(("\n", " ")):
+            text = text.lstrip(" ")
+        if parts and text.startswith("\n"):
+            parts[-1] = parts[-1].rstrip(" ")
+        parts.append(text)
+    return "".join(parts)
+
+
+def _render_tag(tag: Tag) -> str:
+    """Emit Markdown for the subset of HTML found in cleaned Confluence storage format."""
+    name = tag.name
+    if name in ("h1", "h2", "h3", "h4", "h5", "h6"):
+        text = _WHITESPACE_RE.sub(" ", _render_children(tag)).strip()
+        return f"\n\n{'#' * int(name[1])} {text}\n\n"
+    if name == "p":
+        return f"\n\n{_render_children(tag).strip()}\n\n"
+    if name == "br":
+        return "\n"
+    if name == "hr":
+        return "\n\n---\n\n"
+    if name == "pre":
+        code = tag.get_text().strip("\n")
+        return f"\n\n```\n{code}\n```\n\n"
+    if name == "blockquote":
+        lines = _BLANK_LINES_RE.sub("\n\n", _render_children(tag)).strip().splitlines()
+        return "\n\n" + "\n".join(f"> {line}".rstrip() for line in lines) + "\n\n"
+    if name in ("ul", "ol"):
+        return _render_list(tag)
+    if name == "table":
+        return _render_table(tag)
+    if name == "a":
+        text = _render_children(tag)
+        href = tag.get("href")
+        return f"[{text.strip()}]({href})" if href and text.strip() else text
+    if name == "img":
+        src = tag.get("src")
+        return f"![{tag.get('alt', '')}]({src})" if src else ""
+    if name in _INLINE_MARKERS:
+        text = _WHITESPACE_RE.sub(" ", tag.get_text()) if name == "code" else _render_children(tag)
+        return _wrap_inline(text, _INLINE_MARKERS[name])
+    return _render_children(tag)
+
+
+def _wrap_inline(text: str, marker: str) -> str:
+    stripped = text.strip()
+    if not stripped:
+        return text
+    # Keep surrounding whitespace outside the markers, as Markdown requires.
+    leading = " " if text[0].isspace() else ""
+    trailing = " " if text[-1].isspace() else ""
+    return f"{leading}{marker}{stripped}{marker}{trailing}"
+
+
+def _render_list(tag: Tag) -> str:
+    ordered = tag.name == "ol"
+    start = int(tag["start"]) if ordered and str(tag.get("start", "")).isdigit() else 1
+    lines: List[str] = []
+    for index, item in enumerate(tag.find_all("li", recursive=False)):
+        marker = f"{start + index}." if ordered else "*"
+        # Nested lists and paragraphs stay inside the item, indented under its marker.
+        content = _GAP_LINES_RE.sub("\n", _render_children(item).strip())
+        first, *rest = content.splitlines() or [""]
+        lines.append(f"{marker} {first}".rstrip())
+        lines.extend(" " * (len(marker) + 1) + line for line in rest)
+    return "\n\n" + "\n".join(lines) + "\n\n"
+
+
+def _render_table(table: Tag) -> str:
+    rows: List[List[str]] = []
+    has_header = False
+    for row in table.find_all("tr"):
+        if row.find_parent("table") is not table:
+            continue  # Rows of nested tables are rendered as part of their cell.
+        cells = row.find_all(["th", "td"], recursive=False)
+        if not rows:
+            has_header = bool(cells) and all(cell.name == "th" for cell in cells)
+        rows.append([_render_cell(cell) for cell in cells])
+    if not rows:
+        return ""
+
+    width = max(len(row) for row in rows)
+    header = rows.pop(0) if has_header else []
+    lines = [_table_row(header, width), _table_row(["---"] * width, width)]
+    lines.extend(_table_row(row, width) for row in rows)
+    return "\n\n" + "\n".join(lines) + "\n\n"
+
+
+def _render_cell(cell: Tag) -> str:
+    # Nested tables cannot be expressed in a Markdown cell, so they collapse to their text.
+    text = cell.get_text(" ") if cell.find("table") else _render_children(cell)
+    return _WHITESPACE_RE.sub(" ", text).strip().replace("|", "\\|")
+
+
+def _table_row(cells: List[str], width: int) -> str:
+    padded = cells + [""] * (width - len(cells))
+    return f"| {' | '.join(padded)} |"
+
+
 def _split_sections(markdown: str) -> List[Section]:
     if not markdown.strip():
         return [
@@ -67,33 +210,28 @@ def _split_sections(markdown: str) -> List[Section]:
 
     sections: List[Section] = []
     current_title = "Overview"
-    current_lines: List[str] = []
+    body_start = 0
 
-    def flush_section(title: str, lines: List[str]) -> None:
-        body = "\n".join(lines).strip()
+    def flush_section(title: str, body: str) -> None:
         slug = slugify_text(title)
         sections.append(
             Section(
                 id=slug,
                 title=title.strip() or "Untitled Section",
-                body_md=body,
+                body_md=body.strip(),
                 anchors=[slug],
             )
         )
 
-    heading_pattern = re.compile(r"^(#{1,3})\s+(.*)")
-    for line in markdown.splitlines():
-        match = heading_pattern.match(line)
-        if match:
-            if current_lines:
-                flush_section(current_title, current_lines)
-            heading = match.group(2).strip()
-            current_title = heading or "Untitled Section"
-            current_lines = []
-            continue
-        current_lines.append(line)
+    # Bodies are sliced between heading matches instead of re-joining individual lines.
+    for match in _HEADING_RE.finditer(markdown):
+        # A section is only emitted if at least one line precedes the heading.
+        if match.start() > body_start:
+            flush_section(current_title, markdown[body_start : match.start()])
+        current_title = match.group(1).strip() or "Untitled Section"
+        body_start = match.end() + 1
 
-    flush_section(current_title, current_lines)
+    flush_section(current_title, markdown[body_start:])
     return sections
 
 
@@ -142,27 +280,25 @@ def _extract_table(table: Tag) -> dict:
 def _maybe_split_list(value: str | List[str]) -> str | List[str]:
     if not isinstance(value, str):
         return value
-    if ";" in value:
-        parts = [part.strip() for part in value.split(";") if part.strip()]
-        if len(parts) > 1:
-            return parts
-    if "," in value:
-        parts = [part.strip() for part in value.split(",") if part.strip()]
-        if len(parts) > 1:
-            return parts
-    return value
+    # Semicolons take precedence over commas as the list delimiter.
+    separator = ";" if ";" in value else ("," if "," in value else None)
+    if separator is None:
+        return value
+    parts = [part for part in (segment.strip() for segment in value.split(separator)) if part]
+    return parts if len(parts) > 1 else value
 
 
 def _map_tables_to_sections(soup: BeautifulSoup) -> Dict[str, List[dict]]:
     mapping: Dict[str, List[dict]] = {}
-    for table in soup.find_all("table"):
-        heading = table.find_previous(HEADING_TAGS)
-        if heading and heading.get_text(strip=True):
-            section_id = slugify_text(heading.get_text(strip=True))
-        else:
-            section_id = "overview"
-        table_data = _extract_table(table)
-        mapping.setdefault(section_id, []).append(table_data)
+    section_id = "overview"
+    # Headings and tables come back in document order, so one walk pairs each
+    # table with its closest preceding heading.
+    for node in soup.find_all(HEADING_TAGS | {"table"}):
+        if node.name != "table":
+            heading_text = node.get_text(strip=True)
+            section_id = slugify_text(heading_text) if heading_text else "overview"
+            continue
+        mapping.setdefault(section_id, []).append(_extract_table(node))
     return mapping
 
 
@@ -174,9 +310,11 @@ def build_document(
     *,
     space: str,
     base_url: str,
-) -> Tuple[dict, List[dict], Dict[str, str]]:
+    section_cache: Optional[SectionCache] = None,
+) -> Tuple[dict, List[dict], Dict[str, str], SectionCache]:
     page_id = str(page.get("id"))
     title = page.get("title", "Untitled Page")
+    title_slug = slugify_text(title)
     version_info = page.get("version", {}) or {}
     version_number = str(version_info.get("number", "1"))
     version_when = version_info.get("when")
@@ -218,7 +356,7 @@ def build_document(
         "status": "published",
         "product": None,
         "audience": ["internal-support"],
-        "tags": [slugify_text(title), space],
+        "tags": [title_slug, space],
         "domain": ["sorted"],
         "summary": None,
         "source": {
@@ -250,26 +388,32 @@ def build_document(
     chunks: List[dict] = []
     chunk_index: Dict[str, str] = {}
     rank = 0
-    doc_keywords = {slugify_text(title), space.lower(), space}
+    doc_keywords = frozenset({title_slug, space.lower(), space, "sandbox", "production"})
+    # Sections whose body is unchanged since the previous run reuse their chunks and hashes.
+    previous_cache = section_cache or {}
+    next_cache: SectionCache = {}
 
     for section in sections:
-        keywords = set(doc_keywords)
-        keywords.add(slugify_text(section.title))
-        keywords.update({"sandbox", "production"})
-
         if not section.body_md.strip():
             continue
 
-        sentences = split_into_sentences(section.body_md)
-        for idx, chunk_text in enumerate(chunk_sentences(sentences)):
+        # Section ids are already the slug of the section title.
+        keywords = sorted(doc_keywords | {section.id})
+        fingerprint = fingerprint_text(section.body_md)
+        section_chunks = next_cache.get(fingerprint) or previous_cache.get(fingerprint)
+        if section_chunks is None:
+            sentences = split_into_sentences(section.body_md)
+            section_chunks = [[chunk_text, sha256_text(chunk_text)] for chunk_text in chunk_sentences(sentences)]
+        next_cache[fingerprint] = section_chunks
+
+        for chunk_text, text_hash in section_chunks:
             chunk_id = f"{doc_id}::{section.id}#{rank}"
-            text_hash = sha256_text(chunk_text)
             chunk_payload = {
                 "chunk_id": chunk_id,
                 "section_id": section.id,
                 "rank": rank,
                 "text": chunk_text,
-                "keywords": sorted(keywords),
+                "keywords": keywords,
                 "anchors": section.anchors,
                 "text_hash": text_hash,
             }
@@ -278,7 +422,7 @@ def build_document(
             chunk_index[chunk_id] = text_hash
             rank += 1
 
-    return doc, chunks, chunk_index
+    return doc, chunks, chunk_index, next_cache
 
 
 def convert_page(
@@ -286,7 +430,8 @@ def convert_page(
     *,
     space: str,
     base_url: str,
-) -> Tuple[dict, List[dict], Dict[str, str]]:
+    section_cache: Optional[SectionCache] = None,
+) -> Tuple[dict, List[dict], Dict[str, str], SectionCache]:
     body = page.get("body", {}).get("storage", {}).get("value", "") or ""
     soup = _clean_html(body)
     markdown = _html_to_markdown(soup)
@@ -299,4 +444,5 @@ def convert_page(
         table_mapping,
         space=space,
         base_url=base_url,
+        section_cache=section_cache,
     )
@@ -1,18 +1,21 @@
 from __future__ import annotations
 
+import functools
 import hashlib
-import json
 import logging
 import os
 import re
 from pathlib import Path
-from typing import Iterable, List, Sequence
+from typing import BinaryIO, Iterable, List, Sequence
 
+import orjson
+import xxhash
 from slugify import slugify
 
 LOG = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=4096)
 def slugify_text(value: str, separator: str = "-") -> str:
     """Create a deterministic slug for headings, ids, etc."""
     return slugify(value or "unnamed", separator=separator)
@@ -27,27 +30,31 @@ def sha256_text(value: str) -> str:
     return hashlib.sha256(value.encode("utf-8")).hexdigest()
 
 
-_sentence_splitter = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9])")
+def fingerprint_text(value: str) -> str:
+    """Cheap non-cryptographic content fingerprint, used to detect unchanged text between runs."""
+    return xxhash.xxh3_64_hexdigest(value.encode("utf-8"))
+
+
+# A list line (bullet, quote or "1.") is kept whole; anything else is split into
+# sentences at whitespace that follows ".!?" and precedes an uppercase letter or digit.
+_sentence_token = re.compile(
+    r"^[^\S\n]*(?:[-*+>]|\d+\.)[^\n]*"
+    r"|(?=\S)(?:[^.!?\n]+|[.!?](?![^\S\n]+[A-Z0-9]))*[.!?]?",
+    re.MULTILINE,
+)
 
 
 def split_into_sentences(text: str) -> List[str]:
     """Split text into coarse sentences, keeping bullet/numbered lines intact."""
     if not text:
         return []
-    lines: List[str] = []
-    for raw_line in text.strip().splitlines():
-        line = raw_line.strip()
-        if not line:
-            continue
-        if line.startswith(("-", "*", "+", ">")) or re.match(r"^\d+\.", line):
-            lines.append(line)
-            continue
-        sentences = [segment.strip() for segment in _sentence_splitter.split(line) if segment.strip()]
-        if sentences:
-            lines.extend(sentences)
-        else:
-            lines.append(line)
-    return lines
+    return [token.strip() for token in _sentence_token.findall(text)]
+
+
+# Written into section_cache.jsonl; a cache with a different version is discarded.
+# Bump it whenever split_into_sentences, chunk_sentences or their size defaults
+# would produce different chunks for the same section body.
+SECTION_CACHE_VERSION = 1
 
 
 def chunk_sentences(
@@ -81,6 +88,7 @@ def chunk_sentences(
     return chunks
 
 
+
 def ensure_directory(path: str | Path) -> None:
     Path(path).mkdir(parents=True, exist_ok=True)
 
@@ -88,22 +96,26 @@ def ensure_directory(path: str | Path) -> None:
 def load_json(path: str | Path) -> dict:
     if not Path(path).exists():
         return {}
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
 
 
-def write_json(path: str | Path, payload: dict) -> None:
+def write_json(path: str | Path, payload: dict, *, compact: bool = False) -> None:
     ensure_directory(Path(path).parent)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(payload) if compact else orjson.dumps(payload, option=orjson.OPT_INDENT_2))
 
 
 def write_jsonl(path: str | Path, items: Iterable[dict]) -> None:
     ensure_directory(Path(path).parent)
-    with open(path, "w", encoding="utf-8") as f:
-        for item in items:
-            f.write(json.dumps(item, ensure_ascii=False))
-            f.write("\n")
+    with open(path, "wb") as f:
+        dump_jsonl(items, f)
+
+
+def dump_jsonl(items: Iterable[dict], f: BinaryIO) -> None:
+    """Append items to a file opened in binary mode, one JSON object per line."""
+    for item in items:
+        f.write(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE))
 
 
 def copy_env_example(example_path: Path, env_path: Path) -> None:
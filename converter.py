@@ -1,26 +1,46 @@
 from __future__ import annotations
 
 import argparse
-import json
+import contextlib
+import functools
 import logging
+import multiprocessing
 import os
+import re
 import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import BinaryIO, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import orjson
 
 from dotenv import load_dotenv
 from requests import HTTPError
 
 from confluence_converter.api import ConfluenceClient, ConfluenceConfig
-from confluence_converter.conversion import convert_page
-from confluence_converter.utils import copy_env_example, load_json, write_json, write_jsonl
+from confluence_converter.conversion import SectionCache, convert_page
+from confluence_converter.utils import (
+    SECTION_CACHE_VERSION,
+    copy_env_example,
+    dump_jsonl,
+    ensure_directory,
+    load_json,
+    write_json,
+)
 
 LOG = logging.getLogger(__name__)
 PROJECT_ROOT = Path(__file__).resolve().parent
 OUT_ROOT = Path("out")
 DOCS_DIR = OUT_ROOT / "docs"
 CHUNKS_FILE = OUT_ROOT / "chunks" / "chunks.jsonl"
+CHUNKS_TMP_FILE = CHUNKS_FILE.with_name(CHUNKS_FILE.name + ".tmp")
 STATE_FILE = OUT_ROOT / "state" / "emb_index.json"
+SECTION_CACHE_FILE = OUT_ROOT / "state" / "section_cache.jsonl"
+SECTION_CACHE_TMP_FILE = SECTION_CACHE_FILE.with_name(SECTION_CACHE_FILE.name + ".tmp")
+DOCS_MANIFEST_FILE = OUT_ROOT / "state" / "docs_manifest.json"
+# Cache lines are written with "page_id" first, so it can be read without decoding the sections.
+_CACHE_PAGE_ID_RE = re.compile(rb'\{"page_id":("(?:[^"\\]|\\.)*")')
 
 
 def parse_args() -> argparse.Namespace:
@@ -37,19 +57,58 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Include child pages (default: true). Use --no-include-children to disable.",
     )
+    parser.add_argument(
+        "--v2-api",
+        dest="use_v2_api",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Use the Confluence Cloud v2 REST API (default: false).",
+    )
+    parser.add_argument(
+        "--compact",
+        dest="compact",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Write document JSON without indentation (default: false).",
+    )
+    parser.add_argument(
+        "--shard-size",
+        dest="shard_size",
+        type=int,
+        default=None,
+        help="Write documents to JSONL shards of this many docs instead of one file each (default: 0, off).",
+    )
     return parser.parse_args()
 
 
-def env_or_default(args: argparse.Namespace) -> dict:
-    from distutils.util import strtobool
+def _to_bool(value: str) -> bool:
+    """Parse a boolean env value, accepting the same spellings as distutils' strtobool."""
+    normalized = value.strip().lower()
+    if normalized in ("1", "true", "t", "yes", "y", "on"):
+        return True
+    if normalized in ("0", "false", "f", "no", "n", "off"):
+        return False
+    raise ValueError(f"Invalid boolean value: {value!r}")
+
 
+def env_or_default(args: argparse.Namespace) -> dict:
     include_children_env = os.getenv("INCLUDE_CHILDREN", "true")
     include_children = (
         args.include_children
         if args.include_children is not None
-        else bool(strtobool(include_children_env))
+        else _to_bool(include_children_env)
     )
 
+    use_v2_api = (
+        args.use_v2_api
+        if args.use_v2_api is not None
+        else _to_bool(os.getenv("CONF_USE_V2_API", "false"))
+    )
+    compact = args.compact if args.compact is not None else _to_bool(os.getenv("DOCS_COMPACT", "false"))
+    shard_size = args.shard_size if args.shard_size is not None else int(os.getenv("DOCS_SHARD_SIZE", "0"))
+    if shard_size < 0:
+        raise ValueError(f"Invalid shard size: {shard_size}")
+
     config = {
         "base_url": args.base_url or os.getenv("CONF_BASE_URL"),
         "email": args.email or os.getenv("CONF_EMAIL"),
@@ -57,6 +116,9 @@ def env_or_default(args: argparse.Namespace) -> dict:
         "space": args.space or os.getenv("CONF_SPACE"),
         "root_page_id": args.root_page_id or os.getenv("CONF_ROOT_PAGE_ID"),
         "include_children": include_children,
+        "use_v2_api": use_v2_api,
+        "compact": compact,
+        "shard_size": shard_size,
     }
     missing = [key for key, value in config.items() if value in (None, "")]
     if missing:
@@ -71,6 +133,171 @@ def ensure_logging() -> None:
     )
 
 
+def remove_doc_shards(directory: Path, manifest_path: Path) -> None:
+    """Delete a sharded export, starting with its manifest so it never points at missing shards."""
+    manifest_path.unlink(missing_ok=True)
+    for shard in directory.glob("shard-*.jsonl"):
+        shard.unlink()
+
+
+class DocShardWriter:
+    """Append documents to ``shard-NNNNN.jsonl`` files of ``shard_size`` docs each.
+
+    Shards are written under ``.tmp`` names. ``commit`` replaces the previous
+    shards with them and writes the manifest, which maps each document slug to
+    its shard file and line number; ``discard`` removes uncommitted shards.
+    """
+
+    def __init__(self, directory: Path, shard_size: int) -> None:
+        self._directory = directory
+        self._shard_size = shard_size
+        self._count = 0
+        self._file: Optional[BinaryIO] = None
+        self._shard_names: List[str] = []
+        self.manifest: Dict[str, dict] = {}
+
+    def write(self, doc: dict) -> None:
+        shard, line = divmod(self._count, self._shard_size)
+        shard_name = f"shard-{shard:05d}.jsonl"
+        if line == 0:
+            self.close()
+            ensure_directory(self._directory)
+            self._file = open(self._tmp_path(shard_name), "wb")
+            self._shard_names.append(shard_name)
+        dump_jsonl([doc], self._file)
+        self.manifest[doc["slug"]] = {"shard": shard_name, "line": line}
+        self._count += 1
+
+    def commit(self, manifest_path: Path, *, compact: bool = False) -> None:
+        self.close()
+        # Shards left by an earlier, larger export would not be in the new manifest.
+        remove_doc_shards(self._directory, manifest_path)
+        for shard_name in self._shard_names:
+            os.replace(self._tmp_path(shard_name), self._directory / shard_name)
+        self._shard_names = []
+        write_json(manifest_path, self.manifest, compact=compact)
+
+    def discard(self) -> None:
+        self.close()
+        for shard_name in self._shard_names:
+            self._tmp_path(shard_name).unlink(missing_ok=True)
+        self._shard_names = []
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _tmp_path(self, shard_name: str) -> Path:
+        return self._directory / (shard_name + ".tmp")
+
+    def __enter__(self) -> "DocShardWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class SectionCacheReader:
+    """Per-page section caches from the previous run's ``section_cache.jsonl``.
+
+    The file starts with a ``{"version": ...}`` header followed by one
+    ``{"page_id": ..., "sections": ...}`` line per page. Only line offsets are
+    kept in memory, read from each line's ``page_id`` prefix; a page's cache is
+    only parsed when it is requested. A file written with a different
+    ``SECTION_CACHE_VERSION`` is ignored.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._offsets: Dict[str, int] = {}
+        self._file: Optional[BinaryIO] = None
+        if not path.exists():
+            return
+        self._file = open(path, "rb")
+        try:
+            version = orjson.loads(self._file.readline()).get("version")
+        except orjson.JSONDecodeError:
+            version = None
+        if version != SECTION_CACHE_VERSION:
+            LOG.info("Section cache version changed; re-chunking all sections.")
+            self.close()
+            return
+        offset = self._file.tell()
+        for line in self._file:
+            match = _CACHE_PAGE_ID_RE.match(line)
+            if match:
+                self._offsets[orjson.loads(match.group(1))] = offset
+            offset += len(line)
+
+    def get(self, page_id: str) -> Optional[SectionCache]:
+        offset = self._offsets.get(page_id)
+        if offset is None or self._file is None:
+            return None
+        self._file.seek(offset)
+        return orjson.loads(self._file.readline())["sections"]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "SectionCacheReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def iter_converted_pages(
+    client: ConfluenceClient,
+    page_ids: Sequence[str],
+    *,
+    space: str,
+    base_url: str,
+    max_workers: int,
+    section_caches: SectionCacheReader,
+) -> Iterator[Tuple[dict, List[dict], Dict[str, str], SectionCache]]:
+    """Fetch and convert pages, yielding ``convert_page`` results in page order.
+
+    Fetching is network-bound and runs on a thread pool; conversion is CPU-bound
+    and runs on a process pool. Pages that fail to fetch are logged and skipped.
+    """
+    convert = functools.partial(convert_page, space=space, base_url=base_url)
+    cpu_workers = os.cpu_count() or 1
+    fetch_pool = ThreadPoolExecutor(max_workers=max_workers)
+    # Workers start lazily, after the fetch threads are running, so they must not be forked.
+    convert_pool = ProcessPoolExecutor(max_workers=cpu_workers, mp_context=multiprocessing.get_context("spawn"))
+    with fetch_pool, convert_pool:
+        # Both queues are bounded and drained as they are consumed, so neither fetched
+        # pages nor finished documents pile up when one stage outpaces the other.
+        pending_ids = iter(page_ids)
+        fetches: Deque[Tuple[str, Future]] = deque()
+        conversions: Deque[Future] = deque()
+
+        def submit_fetch() -> None:
+            page_id = next(pending_ids, None)
+            if page_id is not None:
+                fetches.append((page_id, fetch_pool.submit(client.fetch_page, page_id)))
+
+        # At most max_workers fetches are outstanding; each consumed fetch starts the next one.
+        for _ in range(max_workers):
+            submit_fetch()
+        while fetches:
+            page_id, fetch = fetches.popleft()
+            submit_fetch()
+            try:
+                page = fetch.result()
+            except HTTPError as exc:
+                LOG.error("Failed to fetch page %s: %s", page_id, exc)
+                continue
+            conversions.append(convert_pool.submit(convert, page, section_cache=section_caches.get(page_id)))
+            # Bound the conversions in flight so finished documents are not buffered without limit.
+            while conversions and (conversions[0].done() or len(conversions) > 2 * cpu_workers):
+                yield conversions.popleft().result()
+        while conversions:
+            yield conversions.popleft().result()
+
+
 def main() -> int:
     ensure_logging()
     copy_env_example(PROJECT_ROOT / ".env.example", PROJECT_ROOT / ".env")
@@ -83,55 +310,78 @@ def main() -> int:
         LOG.error(str(exc))
         return 1
 
-    client = ConfluenceClient(
-        ConfluenceConfig(
-            base_url=settings["base_url"],
-            email=settings["email"],
-            api_token=settings["api_token"],
-        )
+    config = ConfluenceConfig(
+        base_url=settings["base_url"],
+        email=settings["email"],
+        api_token=settings["api_token"],
+        use_v2_api=settings["use_v2_api"],
     )
+    client = ConfluenceClient(config)
 
     page_ids = list(client.traverse_descendants(settings["root_page_id"], settings["include_children"]))
     LOG.info("Processing %s page(s) from space %s", len(page_ids), settings["space"])
 
-    all_chunks: List[dict] = []
     chunk_index: Dict[str, str] = {}
     processed_docs = 0
+    total_chunks = 0
 
-    for page_id in page_ids:
-        try:
-            page = client.fetch_page(page_id)
-        except HTTPError as exc:
-            LOG.error("Failed to fetch page %s: %s", page_id, exc)
-            continue
-
-        doc, chunks, chunk_map = convert_page(
-            page,
-            space=settings["space"],
-            base_url=settings["base_url"],
-        )
-
-        doc_path = DOCS_DIR / (doc["slug"] + ".json")
-        doc_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(doc_path, "w", encoding="utf-8") as f:
-            json.dump(doc, f, ensure_ascii=False, indent=2)
-
-        all_chunks.extend(chunks)
-        chunk_index.update(chunk_map)
-        processed_docs += 1
-        LOG.info(
-            "Exported %s (sections=%s, chunks=%s)",
-            doc["title"],
-            len(doc["sections"]),
-            len(chunks),
-        )
+    # Chunks, section caches and doc shards are streamed to temporary files per page rather
+    # than held for the whole export. They only replace the previous files once the export
+    # succeeded, so a failed or empty run leaves chunks.jsonl in step with emb_index.json.
+    ensure_directory(CHUNKS_FILE.parent)
+    ensure_directory(SECTION_CACHE_FILE.parent)
+    shard_writer = DocShardWriter(DOCS_DIR, settings["shard_size"]) if settings["shard_size"] else None
+    try:
+        with (
+            open(CHUNKS_TMP_FILE, "wb") as chunks_out,
+            open(SECTION_CACHE_TMP_FILE, "wb") as section_cache_out,
+            SectionCacheReader(SECTION_CACHE_FILE) as previous_section_caches,
+            shard_writer or contextlib.nullcontext(),
+        ):
+            dump_jsonl([{"version": SECTION_CACHE_VERSION}], section_cache_out)
+            for doc, chunks, chunk_map, section_cache in iter_converted_pages(
+                client,
+                page_ids,
+                space=settings["space"],
+                base_url=settings["base_url"],
+                max_workers=config.max_workers,
+                section_caches=previous_section_caches,
+            ):
+                if shard_writer is not None:
+                    shard_writer.write(doc)
+                else:
+                    write_json(DOCS_DIR / (doc["slug"] + ".json"), doc, compact=settings["compact"])
+
+                dump_jsonl(chunks, chunks_out)
+                total_chunks += len(chunks)
+                chunk_index.update(chunk_map)
+                # "page_id" must stay the first key; SectionCacheReader indexes lines by it.
+                dump_jsonl([{"page_id": doc["source"]["page_id"], "sections": section_cache}], section_cache_out)
+                processed_docs += 1
+                LOG.info(
+                    "Exported %s (sections=%s, chunks=%s)",
+                    doc["title"],
+                    len(doc["sections"]),
+                    len(chunks),
+                )
+        if processed_docs:
+            os.replace(CHUNKS_TMP_FILE, CHUNKS_FILE)
+            os.replace(SECTION_CACHE_TMP_FILE, SECTION_CACHE_FILE)
+            if shard_writer is not None:
+                shard_writer.commit(DOCS_MANIFEST_FILE, compact=settings["compact"])
+            else:
+                # Per-page files were written, so shards from an earlier sharded run are stale.
+                remove_doc_shards(DOCS_DIR, DOCS_MANIFEST_FILE)
+    finally:
+        CHUNKS_TMP_FILE.unlink(missing_ok=True)
+        SECTION_CACHE_TMP_FILE.unlink(missing_ok=True)
+        if shard_writer is not None:
+            shard_writer.discard()
 
     if not processed_docs:
         LOG.warning("No documents exported.")
         return 0
 
-    write_jsonl(CHUNKS_FILE, all_chunks)
-
     previous_index = load_json(STATE_FILE)
     write_json(STATE_FILE, chunk_index)
 
@@ -140,7 +390,7 @@ def main() -> int:
 
     LOG.info(
         "Chunk export complete: %s chunks total, %s changed/new, %s removed.",
-        len(all_chunks),
+        total_chunks,
         changed_chunks,
         removed_chunks,
     )
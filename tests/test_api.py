@@ -0,0 +1,106 @@
+import unittest
+from unittest import mock
+
+from confluence_converter.api import ConfluenceClient, ConfluenceConfig
+
+BASE_URL = "https://example.test/wiki"
+
+
+class FakeResponse:
+    def __init__(self, payload: dict) -> None:
+        self._payload = payload
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self) -> dict:
+        return self._payload
+
+
+def make_client(routes: dict) -> tuple:
+    """Build a v2 client whose GETs are answered from ``routes``, keyed by (url, params)."""
+    client = ConfluenceClient(ConfluenceConfig(base_url=BASE_URL, email="a@b", api_token="t", use_v2_api=True))
+
+    def get(url, params=None, timeout=None):
+        key = (url, tuple(sorted(params.items())) if params else None)
+        return FakeResponse(routes[key])
+
+    session_get = mock.patch.object(client._session, "get", side_effect=get)
+    return client, session_get
+
+
+class ConfluenceV2ClientTest(unittest.TestCase):
+    def test_children_follow_next_cursor(self) -> None:
+        routes = {
+            (f"{BASE_URL}/api/v2/pages/1/children", (("limit", 250),)): {
+                "results": [{"id": 2, "title": "Two"}],
+                "_links": {"next": "/wiki/api/v2/pages/1/children?cursor=abc&limit=250"},
+            },
+            (f"{BASE_URL}/api/v2/pages/1/children?cursor=abc&limit=250", None): {
+                "results": [{"id": "3", "title": "Three"}, {"title": "No id"}],
+                "_links": {},
+            },
+        }
+        client, session_get = make_client(routes)
+        with session_get as get:
+            self.assertEqual(client.fetch_children_ids("1"), ["2", "3"])
+        self.assertEqual(get.call_count, 2)
+
+    def test_fetch_page_is_shaped_like_v1(self) -> None:
+        routes = {
+            (f"{BASE_URL}/api/v2/pages/3", (("body-format", "storage"),)): {
+                "id": "3",
+                "title": "Leaf",
+                "version": {"number": 4, "createdAt": "2024-01-01T00:00:00Z"},
+                "body": {"storage": {"value": "<p>Hi</p>"}},
+                "_links": {"webui": "/spaces/CSP/pages/3"},
+            },
+            (f"{BASE_URL}/api/v2/pages/3/ancestors", (("limit", 250),)): {
+                "results": [{"id": "1"}, {"id": "2"}],
+                "_links": {},
+            },
+            (f"{BASE_URL}/api/v2/pages", (("id", "1,2"), ("limit", 250))): {
+                "results": [{"id": "2", "title": "Parent"}, {"id": "1", "title": "Root"}],
+                "_links": {},
+            },
+        }
+        client, session_get = make_client(routes)
+        with session_get:
+            page = client.fetch_page("3")
+        self.assertEqual(
+            page,
+            {
+                "id": "3",
+                "title": "Leaf",
+                "version": {"number": 4, "when": "2024-01-01T00:00:00Z"},
+                "ancestors": [{"id": "1", "title": "Root"}, {"id": "2", "title": "Parent"}],
+                "body": {"storage": {"value": "<p>Hi</p>"}},
+                "_links": {"webui": "/spaces/CSP/pages/3"},
+            },
+        )
+
+    def test_ancestor_titles_already_seen_are_not_refetched(self) -> None:
+        routes = {
+            (f"{BASE_URL}/api/v2/pages/1/children", (("limit", 250),)): {
+                "results": [{"id": "2", "title": "Parent"}],
+                "_links": {},
+            },
+            (f"{BASE_URL}/api/v2/pages/3/ancestors", (("limit", 250),)): {
+                "results": [{"id": "1"}, {"id": "2"}],
+                "_links": {},
+            },
+            (f"{BASE_URL}/api/v2/pages", (("id", "1"), ("limit", 250))): {
+                "results": [{"id": "1", "title": "Root"}],
+                "_links": {},
+            },
+        }
+        client, session_get = make_client(routes)
+        with session_get:
+            # Listing page 1's children caches the title of page 2, so only page 1 is looked up.
+            client.fetch_children_ids("1")
+            ancestors = client._fetch_ancestors_v2("3")
+        self.assertEqual(ancestors, [{"id": "1", "title": "Root"}, {"id": "2", "title": "Parent"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from confluence_converter.conversion import _clean_html, _html_to_markdown
+
+
+def to_markdown(html: str) -> str:
+    return _html_to_markdown(_clean_html(html))
+
+
+class HtmlToMarkdownTest(unittest.TestCase):
+    def test_code_macro_keeps_line_breaks(self) -> None:
+        html = (
+            "<p>Before</p>"
+            '<ac:structured-macro ac:name="code">'
+            '<ac:parameter ac:name="language">python</ac:parameter>'
+            "<ac:plain-text-body><![CDATA[def f():\n    return 1 < 2]]></ac:plain-text-body>"
+            "</ac:structured-macro>"
+            '<p>After <ac:structured-macro ac:name="status">'
+            '<ac:parameter ac:name="title">Done</ac:parameter>'
+            "</ac:structured-macro> ok</p>"
+        )
+        self.assertEqual(
+            to_markdown(html),
+            "Before\n\n```\ndef f():\n    return 1 < 2\n```\n\nAfter Done ok",
+        )
+
+    def test_code_macro_nested_in_rich_text_macro(self) -> None:
+        html = (
+            '<ac:structured-macro ac:name="expand">'
+            '<ac:parameter ac:name="title">More</ac:parameter>'
+            "<ac:rich-text-body><p>Inside</p>"
+            '<ac:structured-macro ac:name="noformat">'
+            "<ac:plain-text-body><![CDATA[a\n  b]]></ac:plain-text-body>"
+            "</ac:structured-macro>"
+            "</ac:rich-text-body></ac:structured-macro>"
+        )
+        self.assertEqual(to_markdown(html), "More\n\nInside\n\n```\na\n  b\n```")
+
+    def test_table(self) -> None:
+        html = (
+            "<table><tbody>"
+            "<tr><th>Carrier</th><th>Required</th></tr>"
+            "<tr><td>DHL Paket</td><td>EKP Number</td></tr>"
+            "<tr><td>UPS | Air</td><td><p>Account</p><p>number</p></td></tr>"
+            "</tbody></table>"
+        )
+        self.assertEqual(
+            to_markdown(html),
+            "| Carrier | Required |\n"
+            "| --- | --- |\n"
+            "| DHL Paket | EKP Number |\n"
+            "| UPS \\| Air | Account number |",
+        )
+
+    def test_nested_lists(self) -> None:
+        html = (
+            "<ul>"
+            "<li>One<ul><li>One A</li><li>One <strong>B</strong></li></ul></li>"
+            '<li>Two<ol start="3"><li>Three</li><li>Four</li></ol></li>'
+            "</ul>"
+        )
+        self.assertEqual(
+            to_markdown(html),
+            "* One\n  * One A\n  * One **B**\n* Two\n  3. Three\n  4. Four",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
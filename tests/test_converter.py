@@ -0,0 +1,80 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from converter import DocShardWriter, remove_doc_shards
+
+
+def make_docs(count: int) -> list:
+    return [{"slug": f"root/page-{index}", "title": f"Page {index}"} for index in range(count)]
+
+
+class DocShardWriterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.docs_dir = Path(directory.name) / "docs"
+        self.manifest_path = Path(directory.name) / "state" / "docs_manifest.json"
+
+    def shard_names(self) -> list:
+        return sorted(path.name for path in self.docs_dir.iterdir())
+
+    def test_rolls_over_shards_and_indexes_lines(self) -> None:
+        with DocShardWriter(self.docs_dir, 2) as writer:
+            for doc in make_docs(5):
+                writer.write(doc)
+            writer.commit(self.manifest_path)
+
+        self.assertEqual(self.shard_names(), ["shard-00000.jsonl", "shard-00001.jsonl", "shard-00002.jsonl"])
+        manifest = json.loads(self.manifest_path.read_text())
+        self.assertEqual(manifest["root/page-3"], {"shard": "shard-00001.jsonl", "line": 1})
+        self.assertEqual(manifest["root/page-4"], {"shard": "shard-00002.jsonl", "line": 0})
+        for slug, entry in manifest.items():
+            lines = (self.docs_dir / entry["shard"]).read_text().splitlines()
+            self.assertEqual(json.loads(lines[entry["line"]])["slug"], slug)
+
+    def test_commit_replaces_shards_from_a_larger_export(self) -> None:
+        with DocShardWriter(self.docs_dir, 1) as writer:
+            for doc in make_docs(4):
+                writer.write(doc)
+            writer.commit(self.manifest_path)
+
+        with DocShardWriter(self.docs_dir, 3) as writer:
+            for doc in make_docs(4):
+                writer.write(doc)
+            writer.commit(self.manifest_path)
+
+        self.assertEqual(self.shard_names(), ["shard-00000.jsonl", "shard-00001.jsonl"])
+        self.assertEqual(len(json.loads(self.manifest_path.read_text())), 4)
+
+    def test_discard_keeps_previous_export(self) -> None:
+        with DocShardWriter(self.docs_dir, 2) as writer:
+            for doc in make_docs(3):
+                writer.write(doc)
+            writer.commit(self.manifest_path)
+        manifest = self.manifest_path.read_text()
+
+        writer = DocShardWriter(self.docs_dir, 1)
+        for doc in make_docs(3):
+            writer.write(doc)
+        writer.discard()
+
+        self.assertEqual(self.shard_names(), ["shard-00000.jsonl", "shard-00001.jsonl"])
+        self.assertEqual(self.manifest_path.read_text(), manifest)
+
+    def test_remove_doc_shards(self) -> None:
+        with DocShardWriter(self.docs_dir, 2) as writer:
+            for doc in make_docs(3):
+                writer.write(doc)
+            writer.commit(self.manifest_path)
+        (self.docs_dir / "page.json").write_text("{}")
+
+        remove_doc_shards(self.docs_dir, self.manifest_path)
+
+        self.assertEqual(self.shard_names(), ["page.json"])
+        self.assertFalse(self.manifest_path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from confluence_converter import conversion
+from confluence_converter.conversion import convert_page
+from confluence_converter.utils import SECTION_CACHE_VERSION, dump_jsonl
+from converter import SectionCacheReader
+
+BODY = (
+    "<p>Intro text. Second sentence!</p>"
+    "<h2>Setup</h2><p>Install the client. Then configure it.</p>"
+    "<h2>Usage</h2><ul><li>Run the export</li><li>Check the logs</li></ul>"
+    "<h2>Repeat</h2><p>Install the client. Then configure it.</p>"
+)
+
+
+def make_page(body: str = BODY) -> dict:
+    return {
+        "id": "12345",
+        "title": "Carrier Setup",
+        "version": {"number": 3, "when": "2024-01-01T00:00:00Z"},
+        "ancestors": [{"id": "1", "title": "Root"}],
+        "body": {"storage": {"value": body}},
+        "_links": {"webui": "/spaces/CSP/pages/12345"},
+    }
+
+
+def convert(page: dict, section_cache=None):
+    return convert_page(page, space="CSP", base_url="https://example.test/wiki", section_cache=section_cache)
+
+
+class SectionCacheReuseTest(unittest.TestCase):
+    def test_cached_output_matches_fresh_output(self) -> None:
+        doc, chunks, chunk_index, cache = convert(make_page())
+        with mock.patch.object(conversion, "split_into_sentences", side_effect=AssertionError("re-chunked")):
+            cached_doc, cached_chunks, cached_index, cached_cache = convert(make_page(), section_cache=cache)
+
+        self.assertEqual(cached_chunks, chunks)
+        self.assertEqual(cached_index, chunk_index)
+        self.assertEqual(cached_cache, cache)
+        doc["source"].pop("imported_at")
+        cached_doc["source"].pop("imported_at")
+        self.assertEqual(cached_doc, doc)
+
+    def test_identical_sections_are_chunked_once(self) -> None:
+        with mock.patch.object(conversion, "split_into_sentences", wraps=conversion.split_into_sentences) as split:
+            _, chunks, _, cache = convert(make_page())
+        # Overview, Setup and Usage; Repeat has the same body as Setup.
+        self.assertEqual(split.call_count, 3)
+        self.assertEqual(len(cache), 3)
+        by_section = {chunk["section_id"]: chunk for chunk in chunks}
+        self.assertEqual(by_section["repeat"]["text_hash"], by_section["setup"]["text_hash"])
+        self.assertNotEqual(by_section["repeat"]["chunk_id"], by_section["setup"]["chunk_id"])
+
+    def test_only_changed_sections_are_rechunked(self) -> None:
+        _, _, _, cache = convert(make_page())
+        changed = make_page(BODY.replace("Check the logs", "Check the output"))
+        with mock.patch.object(conversion, "split_into_sentences", wraps=conversion.split_into_sentences) as split:
+            _, chunks, _, next_cache = convert(changed, section_cache=cache)
+
+        self.assertEqual(split.call_count, 1)
+        self.assertIn("* Check the output", [chunk["text"].splitlines()[-1] for chunk in chunks])
+        # Entries for section bodies that no longer exist are not carried over.
+        self.assertEqual(len(next_cache), 3)
+        self.assertNotEqual(set(next_cache), set(cache))
+
+
+class SectionCacheReaderTest(unittest.TestCase):
+    def write_cache(self, version, caches: dict) -> Path:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / "section_cache.jsonl"
+        with open(path, "wb") as f:
+            dump_jsonl([{"version": version}], f)
+            dump_jsonl(({"page_id": page_id, "sections": cache} for page_id, cache in caches.items()), f)
+        return path
+
+    def test_reads_caches_by_page_id(self) -> None:
+        _, _, _, cache = convert(make_page())
+        path = self.write_cache(SECTION_CACHE_VERSION, {"12345": cache, "678": {}})
+        with SectionCacheReader(path) as reader:
+            self.assertEqual(reader.get("12345"), cache)
+            self.assertEqual(reader.get("678"), {})
+            self.assertIsNone(reader.get("999"))
+
+    def test_ignores_cache_with_different_version(self) -> None:
+        _, _, _, cache = convert(make_page())
+        path = self.write_cache(SECTION_CACHE_VERSION + 1, {"12345": cache})
+        with SectionCacheReader(path) as reader:
+            self.assertIsNone(reader.get("12345"))
+
+    def test_missing_file(self) -> None:
+        with SectionCacheReader(Path(tempfile.gettempdir()) / "no-such-cache.jsonl") as reader:
+            self.assertIsNone(reader.get("12345"))
+
+
+if __name__ == "__main__":
+    unittest.main()